@@ -2,14 +2,108 @@ import streamlit as st
 import re
 from datetime import datetime
 from io import BytesIO
-
-# Word
-from docx import Document
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-
-# Excel
-import pandas as pd
+from xml.sax.saxutils import escape as xml_escape
+
+from models import Message
+
+# 对话角色关键词：角色名恰好是关键词时直接查表，
+# 否则用一条预编译正则做包含匹配（如“AI助手”）：先用前瞻在整段中找用户关键词，
+# 找不到再匹配 AI 关键词，保持“用户关键词优先”；lastgroup 即为角色
+_USER_KEYWORDS = frozenset({'用户', '我', 'user', 'me', 'human'})
+_AI_KEYWORDS = frozenset({'ai', 'grok', 'claude', 'chatgpt', 'gpt', 'assistant', '助手', 'bot'})
+_ROLE_BY_KEYWORD = {**dict.fromkeys(_USER_KEYWORDS, 'user'), **dict.fromkeys(_AI_KEYWORDS, 'assistant')}
+_RE_ROLE = re.compile(
+    '^(?=.*?(?P<user>{}))|(?P<assistant>{})'.format(
+        '|'.join(map(re.escape, sorted(_USER_KEYWORDS))),
+        '|'.join(map(re.escape, sorted(_AI_KEYWORDS)))))
+
+# 角色 → 显示名称，导出时按 role 直接查表
+_ROLE_NAMES = {'user': '用户', 'assistant': 'AI助手'}
+
+# Word 样式数值：python-docx 在 generate_word 中按需导入，这里只保存纯数值
+# （字号单位为磅，颜色为十六进制 RGB）
+_WORD_TITLE_PT = 22
+_WORD_META_PT = 10
+_WORD_META_RGB = '808080'
+_WORD_ROLE_PT = 14
+_WORD_USER_RGB = '2563EB'
+_WORD_AI_RGB = '16A34A'
+_WORD_CODE_FONT = 'Courier New'
+_WORD_CODE_PT = 10
+_WORD_CODE_INDENT_PT = 20
+_WORD_TABLE_COL_INCHES = 2.0
+
+# 正文段落直接拼 XML 时使用的属性片段（字号单位为半磅，缩进单位为缇）
+_WORD_ROLE_RPR = '<w:rPr><w:b/><w:color w:val="{}"/><w:sz w:val="%d"/></w:rPr>' % (_WORD_ROLE_PT * 2)
+_WORD_USER_RPR = _WORD_ROLE_RPR.format(_WORD_USER_RGB)
+_WORD_AI_RPR = _WORD_ROLE_RPR.format(_WORD_AI_RGB)
+_WORD_ROLE_RPRS = {'user': _WORD_USER_RPR, 'assistant': _WORD_AI_RPR}
+# 角色标题段落模板：只有轮次随消息变化，其余部分按角色预先拼好，循环中只需 format(i)
+_WORD_ROLE_HEADINGS = {
+    role: f'<w:p><w:r>{_WORD_ROLE_RPRS[role]}<w:t>{xml_escape(name)}（第 {{}} 轮）</w:t></w:r></w:p>'
+    for role, name in _ROLE_NAMES.items()
+}
+_WORD_CODE_PPR = '<w:pPr><w:ind w:left="%d"/></w:pPr>' % (_WORD_CODE_INDENT_PT * 20)
+_WORD_CODE_RPR = '<w:rPr><w:rFonts w:ascii="{0}" w:hAnsi="{0}"/><w:sz w:val="{1}"/></w:rPr>'.format(
+    _WORD_CODE_FONT, _WORD_CODE_PT * 2)
+# 代码段落与普通段落的固定开头/结尾，循环中只拼接文本部分
+_WORD_CODE_P_OPEN = f'<w:p>{_WORD_CODE_PPR}<w:r>{_WORD_CODE_RPR}'
+_WORD_TEXT_P_OPEN = '<w:p><w:r>'
+_WORD_P_CLOSE = '</w:r></w:p>'
+# 表格直接拼 XML，结构与 doc.add_table + 'Table Grid' 样式 + 逐单元格赋值居中的结果一致：
+# 网格列宽固定（缇），单元格宽度 tcW 为版心宽度按列数均分，表头单元格加粗
+_WORD_TABLE_OPEN = (
+    '<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:type="auto" w:w="0"/>'
+    '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+    'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>')
+_WORD_TABLE_GRID_COL = '<w:gridCol w:w="%d"/>' % round(_WORD_TABLE_COL_INCHES * 1440)
+_WORD_TABLE_CELL_OPEN = '<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{}"/></w:tcPr><w:p><w:pPr><w:jc w:val="center"/></w:pPr><w:r>'
+_WORD_TABLE_CELL_CLOSE = '</w:r></w:p></w:tc>'
+_WORD_TABLE_HEADER_RPR = '<w:rPr><w:b/></w:rPr>'
+_RE_WORD_RUN_BREAK = re.compile(r'([\t\r\n])')
+# 正文中的 [代码块] 标记切分
+_RE_WORD_CODE_BLOCK = re.compile(r'\[代码块\](.*?)\[/代码块\]', re.DOTALL)
+
+# clean_special_chars 使用的正则：模块级预编译，每条消息清理时直接复用
+_RE_CODE_BLOCK = re.compile(r'```[\s\S]*?```')
+_RE_INLINE_CODE = re.compile(r'`([^`]+)`')
+_RE_LINK = re.compile(r'\[([^\]]+)\]\([^)]+\)')
+_RE_IMAGE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_RE_HEADING = re.compile(r'^#{1,6}\s+', re.MULTILINE)
+_RE_LIST = re.compile(r'^\s*([-*+•◦➤]|(\d+[.)]))\s+', re.MULTILINE)
+_RE_EMPHASIS_STAR = re.compile(r'(\*{1,3})(.+?)(\*{1,3})(?!\S)', re.DOTALL)
+_RE_EMPHASIS_UNDERSCORE = re.compile(r'(_{1,2})(.+?)(_{1,2})(?!\S)', re.DOTALL)
+_RE_STRIKE = re.compile(r'(~~)(.+?)(~~)(?!\S)', re.DOTALL)
+# 表情符号与常见装饰字符合并为一个字符类（原先的表情子区间均包含在 U+1F000–U+1FFFF 内）
+_SYMBOL_CLASS = r'[\U00002600-\U000027BF\U0001F000-\U0001FFFF★☆♡♥♦♠♣●○◆◇■□▲△▼▽◀▶※♪♫✓✔✕✖]'
+# 孤立强调标记与表情/装饰字符的删除合并为一条正则，一次扫描完成；连续的符号一次匹配整段
+# （强调标记均为 ASCII，与符号类不重叠，结果与原先依次三次 sub 一致）
+_RE_STRIP_MARKS = re.compile(r'\*{2,3}|_{2,3}|~~|' + _SYMBOL_CLASS + '+')
+# 快速路径判定：出现任一 Markdown 标记符、表情或装饰字符就必须走完整清理流程
+_RE_MARKUP_TRIGGER = re.compile(r'[`\[#*_~]|' + _SYMBOL_CLASS)
+_RE_AGGRESSIVE = re.compile(
+    r'[^\u4e00-\u9fffa-zA-Z0-9\s'
+    r'\x00'  # 代码块占位符的分隔符
+    r'\u3000-\u303F\uFF00-\uFFEF'  # 中文标点 + 全角
+    r'。，、；：？！…—～·（）【】《》""''\'\"-.,;:!?()%+*/=&@#$^]')
+# 激进模式的纯 ASCII 快速路径：由上面的正则逐字符推导出要删除的 ASCII 字符，
+# 用 str.translate 一次删除，结果与正则替换一致
+_AGGRESSIVE_ASCII_DROP = dict.fromkeys(c for c in range(128) if _RE_AGGRESSIVE.match(chr(c)))
+# 代码块占位符：\x00序号\x00
+_RE_CODE_PLACEHOLDER = re.compile(r'\x00(\d+)\x00')
+_RE_BLANK_LINES = re.compile(r'\n\s*\n\s*\n+')
+_RE_SPACES = re.compile(r'[ \t]{2,}')
+# 用前瞻只删除空白，标点留在原处，省去分组回填
+_RE_CJK_PUNCT_SPACE = re.compile(r'\s+(?=[，。、；：？！）】》"])')
+# Markdown 表格起点：以 | 开头和结尾的表头行，下一行是含 | 且含 - 或 : 的分隔符行
+_RE_TABLE_START = re.compile(r'^[^\S\n]*\|(?:[^\n]*\|)?[^\S\n]*\n(?=[^\n]*\|)(?=[^\n]*[-:])', re.MULTILINE)
+
+
+def _normalize_spacing(text: str) -> str:
+    """收尾规范化：压缩空行、空格，去掉中文标点前的空白"""
+    text = _RE_BLANK_LINES.sub('\n\n', text)  # 压缩多空行
+    text = _RE_SPACES.sub(' ', text)  # 多空格 → 单空格
+    return _RE_CJK_PUNCT_SPACE.sub('', text)  # 中文标点前去空格
 
 
 def clean_special_chars(text: str, aggressive: bool = False, preserve_code: bool = True) -> str:
@@ -19,116 +113,120 @@ def clean_special_chars(text: str, aggressive: bool = False, preserve_code: bool
     if not text:
         return text
 
+    # 快速路径：普通段落没有任何标记、表情和列表行首时，只需收尾规范化
+    if not aggressive and not _RE_MARKUP_TRIGGER.search(text) and not _RE_LIST.search(text):
+        return _normalize_spacing(text).strip()
+
     # 先提取并保护多行代码块（用特殊标记包裹，防止后续正则干扰）
     code_blocks = []
 
     def replace_code_block(match):
         code_content = match.group(0)[3:-3].strip()  # 去掉```和语言标识，保留纯内容
-        code_blocks.append(code_content)
-        return f"< preserved_code_{len(code_blocks) - 1} >"  # 临时占位符
+        formatted_code = '\n'.join('    ' + line for line in code_content.split('\n'))  # 添加缩进，模拟代码格式
+        code_blocks.append(f"\n[代码块]\n{formatted_code}\n[/代码块]")
+        return f"\x00{len(code_blocks) - 1}\x00"  # 临时占位符：NUL 包裹序号，后续各步正则都不会改动它
 
+    # 先去掉原文中的 NUL：保证占位符不会与用户文本冲突，也避免 NUL 进入导出的 XML
+    text = text.replace('\x00', '')
     if preserve_code:
-        text = re.sub(r'```[\s\S]*?```', replace_code_block, text)
+        text = _RE_CODE_BLOCK.sub(replace_code_block, text)
     else:
         # 如果不保留，直接删除（原有行为）
-        text = re.sub(r'```[\s\S]*?```', '', text)
+        text = _RE_CODE_BLOCK.sub('', text)
 
     # 2. 行内代码 → 只保留内容（但保留在上下文中）
-    text = re.sub(r'`([^`]+)`', r'\1', text)
+    text = _RE_INLINE_CODE.sub(r'\1', text)
 
     # 3. 链接 → 只保留显示文字
-    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
-    text = re.sub(r'!\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    text = _RE_LINK.sub(r'\1', text)
+    text = _RE_IMAGE.sub(r'\1', text)
 
-    # 4. 标题符号
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    # 4. 标题符号（没有 # 时跳过整段的多行扫描）
+    if '#' in text:
+        text = _RE_HEADING.sub('', text)
 
     # 5. 列表符号 → 转成缩进（不直接删除内容）
-    text = re.sub(r'^\s*([-*+•◦➤]|(\d+[.)]))\s+', '  • ', text, flags=re.MULTILINE)
+    text = _RE_LIST.sub('  • ', text)
 
     # 6. 清理强调、删除线 - 更安全版本
-    for mark in [r'\*{1,3}', r'_{1,2}', r'~~']:
-        pattern = rf'({mark})(.+?)({mark})(?!\S)'
-        text = re.sub(pattern, r'\2', text, flags=re.DOTALL)
-
-    # 清理孤立标记
-    text = re.sub(r'\*{2,3}|_{2,3}|~~|\*\*', '', text)
-
-    # 7. 移除表情符号和常见装饰字符
-    text = re.sub(
-        r'[\U0001F300-\U0001F9FF\U0001FA00-\U0001FAFF'
-        r'\U00002700-\U000027BF\U00002600-\U000026FF'
-        r'\U0001F000-\U0001FFFF]+', '', text)
-    text = re.sub(r'[★☆♡♥♦♠♣●○◆◇■□▲△▼▽◀▶※♪♫✓✔✕✖]', '', text)
+    # 开闭标记长度可以不同（如 *a**），无法合并成反向引用的单条正则；
+    # 改为先用 in 判断标记字符是否存在，没有就跳过该次整段扫描
+    if '*' in text:
+        text = _RE_EMPHASIS_STAR.sub(r'\2', text)
+    if '_' in text:
+        text = _RE_EMPHASIS_UNDERSCORE.sub(r'\2', text)
+    if '~~' in text:
+        text = _RE_STRIKE.sub(r'\2', text)
+
+    # 清理孤立标记；7. 移除表情符号和常见装饰字符（合并为一次扫描）
+    text = _RE_STRIP_MARKS.sub('', text)
 
     # 8. 激进模式（只做最必要的过滤）
     if aggressive:
-        text = re.sub(
-            r'[^\u4e00-\u9fffa-zA-Z0-9\s'
-            r'\u3000-\u303F\uFF00-\uFFEF'  # 中文标点 + 全角
-            r'。，、；：？！…—～·（）【】《》""''\'\"-.,;:!?()%+*/=&@#$^]',
-            '', text)
+        if text.isascii():
+            text = text.translate(_AGGRESSIVE_ASCII_DROP)
+        else:
+            text = _RE_AGGRESSIVE.sub('', text)
 
     # 9. 收尾规范化
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # 压缩多空行
-    text = re.sub(r'[ \t]{2,}', ' ', text)  # 多空格 → 单空格
-    text = re.sub(r'\s+([，。、；：？！）】》"])', r'\1', text)  # 中文标点前去空格
+    text = _normalize_spacing(text)
 
-    # 最后，放回保护的代码块（可选：添加换行和缩进以保持可读性）
-    for i, code in enumerate(code_blocks):
-        formatted_code = '\n'.join('    ' + line for line in code.split('\n'))  # 添加缩进，模拟代码格式
-        text = text.replace(f"< preserved_code_{i} >", f"\n[代码块]\n{formatted_code}\n[/代码块]")
+    # 最后，一次扫描放回所有保护的代码块（已在提取时加好换行和缩进）
+    if code_blocks:
+        text = _RE_CODE_PLACEHOLDER.sub(lambda m: code_blocks[int(m.group(1))], text)
 
     return text.strip()
 
 
 def parse_dialog(text: str) -> list:
-    """对话解析 - 保持不变"""
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    """对话解析：按“角色：内容”识别发言，返回 Message 列表"""
     messages = []
+    add_message = messages.append
     current_role = None
     current_content = []
+    add_line = current_content.append
 
-    user_keywords = {'用户', '我', 'user', 'me', 'human'}
-    ai_keywords = {'ai', 'grok', 'claude', 'chatgpt', 'gpt', 'assistant', '助手', 'bot'}
+    # 每行只 strip 一次且跳过空行，拼接结果首尾不会有空白，无需再整体 strip。
+    # 只按 \n 分行：splitlines() 还会在 \x0b、\x0c、\x1c-\x1e、\x85、\u2028、\u2029 处断行，
+    # 网页/PDF 复制的文本常含这些字符，会凭空多出行甚至新的角色轮次
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
 
-    for line in lines:
         role = None
         content = line
 
-        if '：' in line or ':' in line:
-            sep = '：' if '：' in line else ':'
-            parts = line.split(sep, 1)
-            role_part = parts[0].strip().lower()
-            content_part = parts[1].strip() if len(parts) > 1 else ''
+        # 优先按中文冒号切分；partition 一次完成查找与切分
+        head, sep, tail = line.partition('：')
+        if not sep:
+            head, sep, tail = line.partition(':')
 
-            if any(k in role_part for k in user_keywords):
-                role = 'user'
-                content = content_part
-            elif any(k in role_part for k in ai_keywords):
-                role = 'assistant'
-                content = content_part
+        if sep:
+            role_part = head.strip().lower()
+
+            role = _ROLE_BY_KEYWORD.get(role_part)
+            if role is None:
+                match = _RE_ROLE.search(role_part)
+                if match:
+                    role = match.lastgroup
+            if role:
+                content = tail.strip()
 
         if role:
             if current_role and current_content:
-                messages.append({
-                    'role': current_role,
-                    'content': '\n'.join(current_content).strip()
-                })
+                add_message(Message(current_role, '\n'.join(current_content)))
             current_role = role
-            current_content = [content] if content else []
+            current_content.clear()
+            if content:
+                add_line(content)
         else:
-            if current_role:
-                current_content.append(line)
-            else:
+            if not current_role:
                 current_role = 'user'
-                current_content = [line]
+            add_line(line)
 
     if current_role and current_content:
-        messages.append({
-            'role': current_role,
-            'content': '\n'.join(current_content).strip()
-        })
+        add_message(Message(current_role, '\n'.join(current_content)))
 
     return messages
 
@@ -138,64 +236,54 @@ def parse_markdown_tables(content):
     解析 content 中的所有 Markdown 表格，返回列表：每个元素是 (pre_text, header, rows, post_text)
     如果没有表格，返回 [(content, None, None, '')]
     """
+    # 快速路径：大多数消息没有任何 |，不可能含表格，无需逐行扫描
+    if '|' not in content:
+        return [(content, None, None, '')]
+
     parts = []
-    last_end = 0
+    last_end = 0  # 上一个表格之后的第一行的起始偏移
 
     # 匹配 Markdown 表格：表头 | 分隔符 | 数据行
-    # 允许表格前后有其他内容
-    lines = content.split('\n')
-    i = 0
-
-    while i < len(lines):
-        line = lines[i].strip()
-
-        # 检测表头（以 | 开头和结尾）
-        if line and line.startswith('|') and line.endswith('|'):
-            # 可能是表格的开始
-            table_start = i
-            header_line = line
-
-            # 检查下一行是否是分隔符
-            if i + 1 < len(lines):
-                separator_line = lines[i + 1].strip()
-                # 分隔符行应该包含 - 和 |
-                if separator_line and '|' in separator_line and ('-' in separator_line or ':' in separator_line):
-                    # 这是一个表格！
-                    # 解析表头
-                    header = [cell.strip() for cell in header_line.split('|')[1:-1]]
-
-                    # 收集数据行
-                    data_rows = []
-                    j = i + 2
-                    while j < len(lines):
-                        row_line = lines[j].strip()
-                        # 检查是否是表格行
-                        if row_line and row_line.startswith('|') and row_line.endswith('|'):
-                            row_cells = [cell.strip() for cell in row_line.split('|')[1:-1]]
-                            # 确保列数匹配
-                            if len(row_cells) == len(header):
-                                data_rows.append(row_cells)
-                                j += 1
-                            else:
-                                break
-                        else:
-                            break
-
-                    # 提取前置文本
-                    pre_text = '\n'.join(lines[last_end:table_start]).strip()
-
-                    # 记录表格
-                    parts.append((pre_text, header, data_rows, ''))
-
-                    # 更新位置
-                    last_end = j
-                    i = j
-                    continue
-
-        i += 1
+    # 允许表格前后有其他内容；表头和分隔符由正则在整段文本上一次扫描定位，
+    # 不含表格的部分不再逐行切分、strip 和判断
+    length = len(content)
+    while True:
+        m = _RE_TABLE_START.search(content, last_end)
+        if m is None:
+            break
+
+        # 这是一个表格！解析表头
+        header = [cell.strip() for cell in m.group().strip().split('|')[1:-1]]
+
+        # 收集数据行：跳过分隔符行（从 m.end() 开始），pos 始终指向当前行的开头，
+        # 超过 length 表示已没有下一行
+        data_rows = []
+        # 列数匹配等价于 | 的个数为列数 + 1，先计数，不匹配的行不必拆分
+        expected_pipes = len(header) + 1
+        separator_end = content.find('\n', m.end())
+        pos = length + 1 if separator_end < 0 else separator_end + 1
+        while pos <= length:
+            line_end = content.find('\n', pos)
+            if line_end < 0:
+                line_end = length
+            row_line = content[pos:line_end].strip()
+            # 检查是否是表格行，且列数匹配
+            if (row_line and row_line.startswith('|') and row_line.endswith('|')
+                    and row_line.count('|') == expected_pipes):
+                data_rows.append([cell.strip() for cell in row_line.split('|')[1:-1]])
+                pos = line_end + 1
+            else:
+                break
+
+        # 提取前置文本，记录表格
+        pre_text = content[last_end:m.start()].strip()
+        parts.append((pre_text, header, data_rows, ''))
+
+        # 更新位置：从表格后的第一行继续查找
+        last_end = pos
 
     # 处理最后的后置文本
-    post_text = '\n'.join(lines[last_end:]).strip()
+    post_text = content[last_end:].strip()
 
     if parts:
         # 将后置文本添加到最后一个 part
@@ -209,83 +297,145 @@ def parse_markdown_tables(content):
     return parts
 
 
-def generate_word(messages, title):
-    doc = Document()
+def word_run_xml(text):
+    """
+    将文本转换为 <w:r> 内部的 XML：制表符 → <w:tab/>，换行 → <w:br/>，
+    首尾有空白的文本段加 xml:space="preserve"，与 python-docx 的 add_run(text) 结果一致
+    """
+    # 转义不会引入或去掉 \t\r\n 及首尾空白，因此整段只转义一次，再按换行/制表符切分
+    text = xml_escape(text)
+    # 单行且不含制表符的文本（最常见的情况）不需要切分
+    if '\n' in text or '\t' in text or '\r' in text:
+        pieces = _RE_WORD_RUN_BREAK.split(text)
+    else:
+        pieces = (text,)
+    xml = []
+    for piece in pieces:
+        if not piece:
+            continue
+        if piece == '\t':
+            xml.append('<w:tab/>')
+        elif piece == '\n' or piece == '\r':
+            xml.append('<w:br/>')
+        elif len(piece.strip()) < len(piece):
+            xml.append(f'<w:t xml:space="preserve">{piece}</w:t>')
+        else:
+            xml.append(f'<w:t>{piece}</w:t>')
+    return ''.join(xml)
+
+
+def iter_code_chunks(text):
+    """
+    按 [代码块]...[/代码块] 标记一次扫描切分文本，依次产出 (kind, chunk)：
+    kind 为 'code'（标记内的代码）或 'text'（标记外的正文）
+    """
+    # 多数文本段不含代码块标记，直接作为单个正文片段，省去一次 DOTALL 扫描
+    if '[代码块]' not in text:
+        yield 'text', text
+        return
+    pos = 0
+    for m in _RE_WORD_CODE_BLOCK.finditer(text):
+        if m.start() > pos:
+            yield 'text', text[pos:m.start()]
+        yield 'code', m.group(1)
+        pos = m.end()
+    if pos < len(text):
+        yield 'text', text[pos:]
+
+
+@st.cache_resource(show_spinner=False)
+def word_template():
+    """
+    空白 Word 文档模板的字节内容。python-docx 每次 Document() 都要从磁盘读取并解析默认模板，
+    这里只读取一次，之后的导出直接从内存中的字节打开。
+    Streamlit 每次重跑都会重新执行本脚本，lru_cache 会随之失效，因此用 st.cache_resource 跨重跑保留。
+    """
+    from docx import Document
+
+    buffer = BytesIO()
+    Document().save(buffer)
+    return buffer.getvalue()
+
+
+def generate_word(messages, title, export_time=None):
+    # python-docx 只在导出 Word 时才导入，只用 Excel 的会话不承担其导入开销
+    from docx import Document
+    from docx.shared import Pt, RGBColor, Emu
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls
+
+    doc = Document(BytesIO(word_template()))
+    export_time = export_time or datetime.now()
 
     # 标题
     p = doc.add_paragraph(title)
     p.alignment = WD_ALIGN_PARAGRAPH.CENTER
     run = p.runs[0]
-    run.font.size = Pt(22)
+    run.font.size = Pt(_WORD_TITLE_PT)
     run.bold = True
 
     # 元信息
     p = doc.add_paragraph(
-        f"导出时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M')}\n"
+        f"导出时间：{export_time.strftime('%Y年%m月%d日 %H:%M')}\n"
         f"消息数量：{len(messages)} 条"
     )
     p.alignment = WD_ALIGN_PARAGRAPH.CENTER
     run = p.runs[0]
-    run.font.size = Pt(10)
-    run.font.color.rgb = RGBColor(128, 128, 128)
+    run.font.size = Pt(_WORD_META_PT)
+    run.font.color.rgb = RGBColor.from_string(_WORD_META_RGB)
 
     doc.add_paragraph()
 
+    # 正文段落和表格全部先拼成 XML 字符串，最后一次解析并插入，
+    # 避免 python-docx 逐段落、逐单元格、逐字符构建元素树的开销
+    xml_parts = []
+
+    # 版心宽度（页宽减左右页边距），表格单元格宽度按列数均分
+    section = doc.sections[-1]
+    block_width = section.page_width - section.left_margin - section.right_margin
+
+    def add_table(header, rows):
+        cell_open = _WORD_TABLE_CELL_OPEN.format(Emu(block_width // len(header)).twips)
+        xml_parts.append(_WORD_TABLE_OPEN)
+        xml_parts.append('<w:tblGrid>' + _WORD_TABLE_GRID_COL * len(header) + '</w:tblGrid>')
+        xml_parts.append('<w:tr>' + ''.join(
+            cell_open + _WORD_TABLE_HEADER_RPR + word_run_xml(h) + _WORD_TABLE_CELL_CLOSE for h in header
+        ) + '</w:tr>')
+        for row_data in rows:
+            xml_parts.append('<w:tr>' + ''.join(
+                cell_open + word_run_xml(cell_text) + _WORD_TABLE_CELL_CLOSE for cell_text in row_data
+            ) + '</w:tr>')
+        xml_parts.append('</w:tbl>')
+
+    def add_text(text):
+        for kind, part in iter_code_chunks(text):
+            if part.strip():
+                if kind == 'code':
+                    xml_parts.append(_WORD_CODE_P_OPEN + word_run_xml(part) + _WORD_P_CLOSE)
+                else:
+                    xml_parts.append(_WORD_TEXT_P_OPEN + word_run_xml(part) + _WORD_P_CLOSE)
+
     for i, msg in enumerate(messages, 1):
-        p = doc.add_paragraph()
-        role_text = f"用户（第 {i} 轮）" if msg['role'] == 'user' else f"AI助手（第 {i} 轮）"
-        run = p.add_run(role_text)
-        run.bold = True
-        run.font.size = Pt(14)
-
-        if msg['role'] == 'user':
-            run.font.color.rgb = RGBColor(37, 99, 235)
-        else:
-            run.font.color.rgb = RGBColor(22, 163, 74)
+        xml_parts.append(_WORD_ROLE_HEADINGS[msg.role].format(i))
 
         # 解析表格和代码
-        parts = parse_markdown_tables(msg['content'])
+        parts = parse_markdown_tables(msg.content)
         for pre_text, header, rows, post_text in parts:
             if pre_text:
-                content_parts = re.split(r'\[代码块\](.*?)\[/代码块\]', pre_text, flags=re.DOTALL)
-                for part in content_parts:
-                    if part.strip():
-                        p = doc.add_paragraph(part)
-                        if re.match(r'^\s*\n', part):  # 代码
-                            for run in p.runs:
-                                run.font.name = 'Courier New'
-                                run.font.size = Pt(10)
-                            p.paragraph_format.left_indent = Pt(20)  # 缩进
+                add_text(pre_text)
 
             if header and rows:
-                table = doc.add_table(rows=len(rows) + 1, cols=len(header))
-                table.style = 'Table Grid'  # 使用网格样式
-                hdr_cells = table.rows[0].cells
-                for j, h in enumerate(header):
-                    hdr_cells[j].text = h
-                    hdr_cells[j].paragraphs[0].runs[0].bold = True
-                    hdr_cells[j].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-                for row_idx, row_data in enumerate(rows, 1):
-                    row_cells = table.rows[row_idx].cells
-                    for j, cell_text in enumerate(row_data):
-                        row_cells[j].text = cell_text
-                        row_cells[j].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-                # 调整列宽（可选）
-                for column in table.columns:
-                    column.width = Inches(2.0)  # 根据需要调整
+                add_table(header, rows)
 
             if post_text:
-                content_parts = re.split(r'\[代码块\](.*?)\[/代码块\]', post_text, flags=re.DOTALL)
-                for part in content_parts:
-                    if part.strip():
-                        p = doc.add_paragraph(part)
-                        if re.match(r'^\s*\n', part):  # 代码
-                            for run in p.runs:
-                                run.font.name = 'Courier New'
-                                run.font.size = Pt(10)
-                            p.paragraph_format.left_indent = Pt(20)  # 缩进
+                add_text(post_text)
+
+    if xml_parts:
+        body = doc.element.body
+        fragment = parse_xml(f'<w:body {nsdecls("w")}>{"".join(xml_parts)}</w:body>')
+        for element in list(fragment):
+            body.sectPr.addprevious(element)
 
     buffer = BytesIO()
     doc.save(buffer)
@@ -293,19 +443,35 @@ def generate_word(messages, title):
     return buffer
 
 
-def generate_excel(messages, title, pure_mode=False):
+def format_excel_content(content):
+    """将消息内容中的 Markdown 表格转换为易读文本，用于 Excel 完整模式的“内容”列"""
+    display_parts = []
+
+    for pre_text, header, rows, post_text in parse_markdown_tables(content):
+        if pre_text:
+            display_parts.append(pre_text)
+
+        if header and rows:
+            # 将表格转换为易读的文本格式（收集行后一次性 join，避免反复拼接字符串）
+            table_lines = [' | '.join(header), '-' * 50]
+            table_lines.extend(' | '.join(row) for row in rows)
+            display_parts.append('\n'.join(table_lines).strip())
+
+        if post_text:
+            display_parts.append(post_text)
+
+    return '\n\n'.join(display_parts)
+
+
+@st.cache_resource(show_spinner=False)
+def excel_named_styles():
     """
-    导出Excel，支持两种模式：
-    1. 完整模式（pure_mode=False）：包含轮次、角色等信息
-    2. 纯表格模式（pure_mode=True）：只导出表格数据，去除所有元数据
+    Excel 命名样式的组成部分（字体/填充/对齐/边框）。
+    这些样式对象不可变，首次导出时创建一次，之后所有工作簿共用（st.cache_resource 跨重跑保留）；
+    NamedStyle 本身会绑定到具体工作簿，因此仍在每次导出时包装。
     """
-    from openpyxl import Workbook
     from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-
-    buffer = BytesIO()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "对话记录"
+    from openpyxl.styles.fonts import DEFAULT_FONT
 
     thin_border = Border(
         left=Side(style='thin'),
@@ -313,116 +479,169 @@ def generate_excel(messages, title, pure_mode=False):
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
+    header_fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
+    center = Alignment(horizontal='center', vertical='center')
+
+    return (
+        ('table_header', dict(font=Font(bold=True, size=11), fill=header_fill,
+                              alignment=center, border=thin_border)),
+        ('dialog_header', dict(font=Font(bold=True, size=12), fill=header_fill,
+                               alignment=center, border=thin_border)),
+        ('center_cell', dict(font=DEFAULT_FONT, alignment=center, border=thin_border)),
+        ('content_cell', dict(font=DEFAULT_FONT, border=thin_border,
+                              alignment=Alignment(wrap_text=True, vertical='top', horizontal='left'))),
+    )
+
+
+def generate_excel(messages, title, pure_mode=False):
+    """
+    导出Excel，支持两种模式：
+    1. 完整模式（pure_mode=False）：包含轮次、角色等信息
+    2. 纯表格模式（pure_mode=True）：只导出表格数据，去除所有元数据
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import NamedStyle
+    from openpyxl.utils import get_column_letter
+
+    buffer = BytesIO()
+    # write_only 模式按行流式写出，不在内存中保留整张表
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("对话记录")
+
+    # 样式以命名样式注册一次，单元格只引用名称
+    for name, parts in excel_named_styles():
+        wb.add_named_style(NamedStyle(name, **parts))
+
+    def styled_row(values, style):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = style
+            cells.append(cell)
+        return cells
 
     if pure_mode:
         # 纯表格模式：只保留表格数据
-        current_row = 1
-        first_table = True
-
-        for msg in messages:
-            parts = parse_markdown_tables(msg['content'])
-
-            for pre_text, header, rows, post_text in parts:
-                if header and rows:
-                    # 如果不是第一个表格，空两行
-                    if not first_table:
-                        current_row += 2
-                    first_table = False
-
-                    # 写入表头
-                    for col_idx, col_name in enumerate(header, 1):
-                        cell = ws.cell(row=current_row, column=col_idx)
-                        cell.value = col_name
-                        cell.font = Font(bold=True, size=11)
-                        cell.fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
-                        cell.alignment = Alignment(horizontal='center', vertical='center')
-                        cell.border = thin_border
-                        ws.column_dimensions[cell.column_letter].width = 12
-
-                    current_row += 1
-
-                    # 写入数据行
-                    for row_data in rows:
-                        for col_idx, cell_value in enumerate(row_data, 1):
-                            cell = ws.cell(row=current_row, column=col_idx)
-                            cell.value = cell_value
-                            cell.alignment = Alignment(horizontal='center', vertical='center')
-                            cell.border = thin_border
-                        current_row += 1
+        tables = [
+            (header, rows)
+            for msg in messages
+            for pre_text, header, rows, post_text in parse_markdown_tables(msg.content)
+            if header and rows
+        ]
+
+        # write_only 模式下列宽必须在写入行之前设置
+        max_cols = max((len(header) for header, rows in tables), default=0)
+        for col_idx in range(1, max_cols + 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = 12
+
+        for table_idx, (header, rows) in enumerate(tables):
+            # 如果不是第一个表格，空两行
+            if table_idx:
+                ws.append([])
+                ws.append([])
+
+            # 写入表头
+            ws.append(styled_row(header, 'table_header'))
+
+            # 写入数据行
+            for row_data in rows:
+                ws.append(styled_row(row_data, 'center_cell'))
 
         wb.save(buffer)
 
     else:
         # 完整模式：包含对话信息
-        current_row = 1
-
-        # 设置表头
-        headers = ['轮次', '角色', '内容', '字数']
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_idx)
-            cell.value = header
-            cell.font = Font(bold=True, size=12)
-            cell.fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
         # 设置列宽
         ws.column_dimensions['A'].width = 8
         ws.column_dimensions['B'].width = 12
         ws.column_dimensions['C'].width = 100
         ws.column_dimensions['D'].width = 10
 
-        current_row = 2
+        # 设置表头
+        ws.append(styled_row(['轮次', '角色', '内容', '字数'], 'dialog_header'))
 
+        # 逐条消息格式化并立即写出一行：write_only 工作表把行流式写入临时文件，
+        # 格式化后的内容写出后即可释放，不必整列保留在内存中
         for i, msg in enumerate(messages, 1):
-            # 解析内容
-            content = msg['content']
-            parts = parse_markdown_tables(content)
+            clean_content = format_excel_content(msg.content)
+            round_cell, role_cell, count_cell = styled_row(
+                (i, _ROLE_NAMES[msg.role], len(clean_content)), 'center_cell')
+            content_cell = WriteOnlyCell(ws, value=clean_content)
+            content_cell.style = 'content_cell'
+            ws.append([round_cell, role_cell, content_cell, count_cell])
+
+        wb.save(buffer)
 
-            # 组装显示内容
-            display_parts = []
+    buffer.seek(0)
+    return buffer
 
-            for pre_text, header, rows, post_text in parts:
-                if pre_text:
-                    display_parts.append(pre_text)
 
-                if header and rows:
-                    # 将表格转换为易读的文本格式
-                    table_text = ' | '.join(header) + '\n'
-                    table_text += '-' * 50 + '\n'
-                    for row in rows:
-                        table_text += ' | '.join(row) + '\n'
-                    display_parts.append(table_text.strip())
+@st.cache_data(max_entries=32, show_spinner=False)
+def prepare_export_messages(messages, auto_clean, aggressive, preserve_code):
+    """
+    按导出设置得到最终写入文件的消息；开启自动清理时逐条清理内容。
+    结果按 (消息, 清理选项) 缓存，重跑或切换导出格式时不再重复清理。
+    """
+    if not auto_clean:
+        return messages
+    return [
+        Message(m.role, clean_special_chars(m.content, aggressive=aggressive, preserve_code=preserve_code))
+        for m in messages
+    ]
 
-                if post_text:
-                    display_parts.append(post_text)
 
-            clean_content = '\n\n'.join(display_parts)
+@st.cache_data(max_entries=16, show_spinner=False)
+def parse_dialog_cached(text: str) -> tuple:
+    """
+    带缓存的 parse_dialog：文本不变时，重跑和按钮点击直接复用解析结果。
+    返回 (messages, total_chars)，总字符数随解析结果一起缓存。
+    """
+    messages = parse_dialog(text)
+    return messages, sum(len(m.content) for m in messages)
 
-            # 写入数据
-            ws.cell(row=current_row, column=1).value = i
-            ws.cell(row=current_row, column=1).alignment = Alignment(horizontal='center', vertical='center')
 
-            ws.cell(row=current_row, column=2).value = '用户' if msg['role'] == 'user' else 'AI助手'
-            ws.cell(row=current_row, column=2).alignment = Alignment(horizontal='center', vertical='center')
+@st.cache_data(max_entries=8, show_spinner=False)
+def export_word_bytes(messages, title, export_time):
+    """带缓存的 Word 导出；export_time 精确到分钟，保证文档中的导出时间不过期"""
+    return generate_word(messages, title, export_time).getvalue()
 
-            content_cell = ws.cell(row=current_row, column=3)
-            content_cell.value = clean_content
-            content_cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
 
-            ws.cell(row=current_row, column=4).value = len(clean_content)
-            ws.cell(row=current_row, column=4).alignment = Alignment(horizontal='center', vertical='center')
+@st.cache_data(max_entries=8, show_spinner=False)
+def export_excel_bytes(messages, title, pure_mode):
+    """带缓存的 Excel 导出，重复点击生成按钮时直接返回已生成的文件"""
+    return generate_excel(messages, title, pure_mode=pure_mode).getvalue()
 
-            current_row += 1
 
-        # 添加边框
-        for row in ws.iter_rows(min_row=1, max_row=current_row - 1, min_col=1, max_col=4):
-            for cell in row:
-                cell.border = thin_border
+# 文本操作按钮的回调：在本次重跑开始前修改 session_state，
+# 文本框随即显示新内容，无需再调用 st.rerun() 触发第二次完整重跑
+def on_clean_text(aggressive, preserve_code):
+    raw_text = st.session_state.current_text
+    if raw_text.strip():
+        if not st.session_state.cleaned_once:
+            st.session_state.original_text = raw_text
+        st.session_state.current_text = clean_special_chars(raw_text, aggressive=aggressive, preserve_code=preserve_code)
+        st.session_state.cleaned_once = True
+        st.toast("清理完成")
 
-        wb.save(buffer)
 
-    buffer.seek(0)
-    return buffer
+def on_restore_text():
+    if st.session_state.original_text:
+        st.session_state.current_text = st.session_state.original_text
+        st.session_state.cleaned_once = False
+
+
+def on_clear_text():
+    for key in ["current_text", "original_text", "cleaned_once"]:
+        if key in st.session_state:
+            del st.session_state[key]
+
+
+# 侧边栏 Excel 导出模式选项：选项文字只在这里定义一处，下方判断纯表格模式时与同一个常量比较
+_EXCEL_MODE_FULL = "完整模式（包含轮次/角色）"
+_EXCEL_MODE_PURE = "纯表格模式（仅保留表格数据）"
+_EXCEL_MODE_OPTIONS = (_EXCEL_MODE_FULL, _EXCEL_MODE_PURE)
+_EXCEL_MODE_HELP = "完整模式：包含对话的轮次、角色等信息\n纯表格模式：只导出表格内容，去除所有元数据"
 
 
 def main():
@@ -452,11 +671,11 @@ def main():
             st.markdown("**Excel 选项：**")
             excel_mode = st.radio(
                 "导出模式",
-                options=["完整模式（包含轮次/角色）", "纯表格模式（仅保留表格数据）"],
+                options=_EXCEL_MODE_OPTIONS,
                 index=1,
-                help="完整模式：包含对话的轮次、角色等信息\n纯表格模式：只导出表格内容，去除所有元数据"
+                help=_EXCEL_MODE_HELP
             )
-            excel_pure_mode = (excel_mode == "纯表格模式（仅保留表格数据）")
+            excel_pure_mode = (excel_mode == _EXCEL_MODE_PURE)
         else:
             excel_pure_mode = False
 
@@ -471,78 +690,67 @@ def main():
     with col1:
         st.subheader("对话内容")
 
-        raw_text = st.text_area(
+        # 文本框直接绑定 session_state.current_text，按钮回调修改该键即可更新显示
+        st.text_area(
             "请粘贴完整对话...",
-            value=st.session_state.current_text,
+            key="current_text",
             height=500
         )
 
-        st.session_state.current_text = raw_text
-
         btn_col1, btn_col2, btn_col3 = st.columns([1, 1, 2])
 
         with btn_col1:
-            if st.button("🧹 清理文本", type="primary"):
-                if raw_text.strip():
-                    if not st.session_state.cleaned_once:
-                        st.session_state.original_text = raw_text
-                    cleaned = clean_special_chars(raw_text, aggressive=aggressive, preserve_code=preserve_code)
-                    st.session_state.current_text = cleaned
-                    st.session_state.cleaned_once = True
-                    st.success("清理完成")
-                    st.rerun()
+            st.button("🧹 清理文本", type="primary", on_click=on_clean_text, args=(aggressive, preserve_code))
 
         with btn_col2:
-            if st.button("↩️ 恢复原始"):
-                if st.session_state.original_text:
-                    st.session_state.current_text = st.session_state.original_text
-                    st.session_state.cleaned_once = False
-                    st.rerun()
+            st.button("↩️ 恢复原始", on_click=on_restore_text)
 
         with btn_col3:
-            if st.button("🗑️ 清空"):
-                for key in ["current_text", "original_text", "cleaned_once"]:
-                    if key in st.session_state:
-                        del st.session_state[key]
-                st.rerun()
+            st.button("🗑️ 清空", on_click=on_clear_text)
+
+    # 每次重跑只解析一次，统计信息和导出部分共用同一结果
+    current_text = st.session_state.current_text
+    if current_text.strip():
+        messages, total_chars = parse_dialog_cached(current_text)
+    else:
+        messages, total_chars = [], 0
 
     with col2:
         st.subheader("统计信息")
-        if st.session_state.current_text.strip():
-            messages = parse_dialog(st.session_state.current_text)
-            if messages:
-                st.metric("消息数量", len(messages))
-                st.metric("总字符数", f"{sum(len(m['content']) for m in messages):,}")
-
-    # 导出部分
-    if st.session_state.current_text.strip():
-        messages = parse_dialog(st.session_state.current_text)
-
-        final_messages = messages
-        if auto_clean:
-            final_messages = []
-            for m in messages:
-                cleaned = clean_special_chars(m['content'], aggressive=aggressive, preserve_code=preserve_code)
-                final_messages.append({'role': m['role'], 'content': cleaned})
-
-        if messages and (export_word or export_excel):
-            st.divider()
-            st.subheader("导出")
-
-            cols = st.columns(2)
-
-            with cols[0]:
-                if export_word and st.button("生成 Word"):
-                    buf = generate_word(final_messages, title)
+        if messages:
+            st.metric("消息数量", len(messages))
+            st.metric("总字符数", f"{total_chars:,}")
+
+    # 导出部分：只有勾选了导出格式才显示；清理只在点击对应生成按钮时进行
+    if messages and (export_word or export_excel):
+        st.divider()
+        st.subheader("导出")
+
+        cols = st.columns(2)
+
+        with cols[0]:
+            if export_word and st.button("生成 Word"):
+                final_messages = prepare_export_messages(messages, auto_clean, aggressive, preserve_code)
+                export_time = datetime.now().replace(second=0, microsecond=0)
+                try:
+                    buf = export_word_bytes(final_messages, title, export_time)
+                except ImportError:
+                    st.error("未安装 python-docx，无法导出 Word：pip install python-docx")
+                else:
                     st.download_button(
                         "⬇️ 下载 Word", buf,
                         f"{title}_{datetime.now():%Y%m%d_%H%M}.docx",
                         "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                     )
 
-            with cols[1]:
-                if export_excel and st.button("生成 Excel"):
-                    buf = generate_excel(final_messages, title, pure_mode=excel_pure_mode)
+        with cols[1]:
+            if export_excel and st.button("生成 Excel"):
+                final_messages = prepare_export_messages(messages, auto_clean, aggressive, preserve_code)
+                try:
+                    buf = export_excel_bytes(final_messages, title, excel_pure_mode)
+                except ImportError:
+                    st.error("未安装 openpyxl，无法导出 Excel：pip install openpyxl")
+                else:
                     st.download_button(
                         "⬇️ 下载 Excel", buf,
                         f"{title}_{datetime.now():%Y%m%d_%H%M}.xlsx",
@@ -0,0 +1,7 @@
+from collections import namedtuple
+
+# 一条对话消息：role 为 'user' 或 'assistant'。
+# 不可变、可哈希，属性访问比字典查找快，也便于作为缓存键。
+# 单独放在可导入的模块中：Streamlit 每次重跑都会重新执行 app.py 并替换 __main__，
+# 定义在 app.py 里的类每次都是新对象，st.cache_data 序列化缓存结果时会因类不一致而失败
+Message = namedtuple('Message', 'role content')